@@ -0,0 +1,137 @@
+import argparse
+import os
+import random
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import urlsplit, parse_qs
+
+# stand-in for 2e.aonprd.com that serves the cached data/ corpus at the same url shapes
+# run the scraper against it with --base-url http://localhost:PORT
+
+# page -> cache directory for the ?id= entry pages
+ENTRY_PAGES = {
+    '/Monsters.aspx': 'creatures',
+    '/Traits.aspx': 'traits',
+    '/Ancestries.aspx': 'ancestries',
+}
+# (page, query) -> cached index page
+INDEX_PAGES = {
+    ('/Monsters.aspx', 'Letter=All'): 'index/monsters.html',
+    ('/Traits.aspx', ''): 'index/traits.html',
+}
+
+
+class AonRequestHandler(BaseHTTPRequestHandler):
+    # set on the subclass made by make_server
+    data_dir: str = 'data'
+    latency: float = 0.0  # seconds added before every response
+    bandwidth: int = 0  # bytes per second, 0 for unlimited
+    error_rate: float = 0.0  # fraction of requests answered with a 500
+    rng: random.Random = random.Random()
+    quiet: bool = True
+
+    def resolve(self) -> Optional[str]:
+        url = urlsplit(self.path)
+        if (url.path, url.query) in INDEX_PAGES:
+            return os.path.join(self.data_dir, INDEX_PAGES[(url.path, url.query)])
+        ids = parse_qs(url.query).get('id')
+        if url.path in ENTRY_PAGES and ids and ids[0].isdigit():
+            return os.path.join(self.data_dir, ENTRY_PAGES[url.path], '{}.html'.format(int(ids[0])))
+        return None
+
+    def not_modified(self, mtime: float, etag: str) -> bool:
+        if self.headers.get('If-None-Match'):
+            return etag in [t.strip() for t in self.headers['If-None-Match'].split(',')]
+        if self.headers.get('If-Modified-Since'):
+            try:
+                return int(mtime) <= parsedate_to_datetime(self.headers['If-Modified-Since']).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.send_error(500, 'injected error')
+            return
+        path = self.resolve()
+        if not path or not os.path.exists(path):
+            self.send_error(404)
+            return
+
+        stat = os.stat(path)
+        etag = '"{:x}-{:x}"'.format(stat.st_size, int(stat.st_mtime))
+        if self.not_modified(stat.st_mtime, etag):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        with open(path, 'rb') as inf:
+            body = inf.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Last-Modified', formatdate(stat.st_mtime, usegmt=True))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.write_throttled(body)
+
+    def write_throttled(self, body: bytes):
+        if not self.bandwidth:
+            self.wfile.write(body)
+            return
+        # 10 writes per second at the configured rate
+        chunk = max(1, self.bandwidth // 10)
+        for i in range(0, len(body), chunk):
+            self.wfile.write(body[i:i + chunk])
+            time.sleep(len(body[i:i + chunk]) / self.bandwidth)
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+def make_server(port: int = 8000, data_dir: str = 'data', latency: float = 0.0, bandwidth: int = 0,
+                error_rate: float = 0.0, seed: int = None, quiet: bool = True) -> ThreadingHTTPServer:
+    handler = type('ConfiguredAonRequestHandler', (AonRequestHandler,), {
+        'data_dir': data_dir,
+        'latency': latency,
+        'bandwidth': bandwidth,
+        'error_rate': error_rate,
+        'rng': random.Random(seed),
+        'quiet': quiet,
+    })
+    return ThreadingHTTPServer(('localhost', port), handler)
+
+
+# serve in a daemon thread, e.g. from a benchmark; the base url is http://localhost:<server.server_port>
+# port 0 picks a free port
+def start_server(port: int = 0, **kwargs) -> ThreadingHTTPServer:
+    server = make_server(port, **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='serve the cached AoN pages in data/ for offline scraping')
+    arg_parser.add_argument('--port', type=int, default=8000)
+    arg_parser.add_argument('--data', default='data', help='cache directory written by scraper.py')
+    arg_parser.add_argument('--latency', type=float, default=0.0, help='seconds to wait before each response')
+    arg_parser.add_argument('--bandwidth', type=int, default=0, help='bytes per second per response, 0 for unlimited')
+    arg_parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests failing with a 500')
+    arg_parser.add_argument('--seed', type=int, help='seed for the injected errors')
+    arg_parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = arg_parser.parse_args()
+
+    aon_server = make_server(args.port, args.data, args.latency, args.bandwidth, args.error_rate, args.seed,
+                             not args.verbose)
+    print('serving {} on http://localhost:{}'.format(args.data, aon_server.server_port))
+    try:
+        aon_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
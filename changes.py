@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Tuple
+
+# field path -> hash of the value at that path, per record id
+Snapshot = Dict[str, Dict[str, str]]
+
+
+def value_hash(value) -> str:
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode('utf8')).hexdigest()[:16]
+
+
+# nested dicts are flattened into dotted paths (e.g. source.page), anything else is hashed as a whole
+def field_hashes(record: dict, prefix: str = '') -> Dict[str, str]:
+    hashes: Dict[str, str] = {}
+    for k, v in record.items():
+        if k == '_id':
+            continue
+        path = '{}{}'.format(prefix, k)
+        if isinstance(v, dict) and v:
+            hashes.update(field_hashes(v, path + '.'))
+        else:
+            hashes[path] = value_hash(v)
+    return hashes
+
+
+def take_snapshot(records: List[dict], key: str = 'id') -> Snapshot:
+    return {str(r.get(key)): field_hashes(r) for r in records}
+
+
+def diff_snapshots(old: Snapshot, new: Snapshot) -> List[dict]:
+    changes: List[dict] = []
+    for r_id, fields in new.items():
+        if r_id not in old:
+            changes.append({'id': r_id, 'change': 'added', 'fields': []})
+            continue
+        old_fields = old[r_id]
+        changed = sorted(path for path in set(fields) | set(old_fields) if fields.get(path) != old_fields.get(path))
+        if changed:
+            changes.append({'id': r_id, 'change': 'modified', 'fields': changed})
+    changes.extend({'id': r_id, 'change': 'removed', 'fields': []} for r_id in old if r_id not in new)
+    return changes
+
+
+# compare records with the snapshot of the previous scrape of collection_name
+# returns the changes and the new snapshot; nothing is saved until save_changes, so call that once the records landed
+# failed: ids that could not be fetched this time, which keep their previous entry instead of showing up as removed
+def compute_changes(records: List[dict], collection_name: str, snapshot_dir: str = 'data/snapshots',
+                    failed: Iterable[int] = ()) -> Tuple[List[dict], Snapshot]:
+    snapshot_path = os.path.join(snapshot_dir, '{}.json'.format(collection_name))
+    old: Snapshot = {}
+    if os.path.exists(snapshot_path):
+        with open(snapshot_path, 'r', encoding='utf-8') as inf:
+            old = json.load(inf)
+    new = take_snapshot(records)
+    for r_id in map(str, failed):
+        if r_id in old and r_id not in new:
+            new[r_id] = old[r_id]
+
+    scraped_at = datetime.now(timezone.utc).isoformat()
+    changes = diff_snapshots(old, new)
+    for c in changes:
+        # snapshot keys are strings, but record ids are ints everywhere else
+        c.update(id=int(c['id']) if c['id'].lstrip('-').isdigit() else c['id'], collection=collection_name,
+                 scrapedAt=scraped_at)
+    return changes, new
+
+
+# append changes as json lines to changes_dir/<collection_name>.jsonl, then replace the snapshot of collection_name
+def save_changes(changes: List[dict], snapshot: Snapshot, collection_name: str,
+                 snapshot_dir: str = 'data/snapshots', changes_dir: str = 'data/changes') -> None:
+    os.makedirs(changes_dir, exist_ok=True)
+    with open(os.path.join(changes_dir, '{}.jsonl'.format(collection_name)), 'a', encoding='utf-8') as outf:
+        outf.writelines(json.dumps(c) + '\n' for c in changes)
+    os.makedirs(snapshot_dir, exist_ok=True)
+    snapshot_path = os.path.join(snapshot_dir, '{}.json'.format(collection_name))
+    # a half written snapshot would make the next run report every record as changed
+    with open(snapshot_path + '.tmp', 'w', encoding='utf-8') as outf:
+        json.dump(snapshot, outf)
+    os.replace(snapshot_path + '.tmp', snapshot_path)
@@ -0,0 +1,56 @@
+import html
+import re
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any
+
+
+class PageKind(Enum):
+    EMPTY = 'empty'  # nothing fetched, or no detailed output on the page
+    NOT_FOUND = 'not found'  # detailed output without a title, which is how AoN renders unknown ids
+    HERITAGE = 'heritage'
+    CREATURE = 'creature'
+    ENTRY = 'entry'  # any other titled page (traits, ancestries, ...)
+
+
+@dataclass
+class PageInfo:
+    kind: PageKind = PageKind.EMPTY
+    title: str = ''
+
+
+# pages can be str, bytes or an mmap, so every pattern exists in both flavours
+def compile_both(pattern: str, flags: int = 0):
+    return re.compile(pattern, flags), re.compile(pattern.encode('utf8'), flags)
+
+
+detail_re = compile_both(r'id="ctl00_MainContent_DetailedOutput"')
+title_re = compile_both(r'<h1[^>]*>(.*?)</h1>', re.DOTALL | re.IGNORECASE)
+tag_re = re.compile(r'<[^>]+>')
+creature_re = compile_both(r'<span[^>]*>[^<]*Creature -?[0-9]+')
+
+
+# classify a page from its raw markup, without building a DOM
+# parsers call this first and skip pages whose kind they do not handle
+def classify_page(page: Any) -> PageInfo:
+    if not page:
+        return PageInfo(PageKind.EMPTY)
+    flavour = 0 if isinstance(page, str) else 1
+    detail = detail_re[flavour].search(page)
+    if not detail:
+        return PageInfo(PageKind.EMPTY)
+    title_match = title_re[flavour].search(page, detail.end())
+    if not title_match:
+        return PageInfo(PageKind.NOT_FOUND)
+
+    title = title_match.group(1)
+    title = title.decode('utf8', errors='replace') if isinstance(title, bytes) else title
+    title = ' '.join(html.unescape(tag_re.sub('', title)).split())
+    if not title:
+        return PageInfo(PageKind.NOT_FOUND)
+    if 'Heritage' in title:
+        return PageInfo(PageKind.HERITAGE, title)
+    # the parser accepts the level span anywhere in the detailed output (even inside the title), so search all of it
+    if creature_re[flavour].search(page, detail.end()):
+        return PageInfo(PageKind.CREATURE, title)
+    return PageInfo(PageKind.ENTRY, title)
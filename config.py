@@ -5,3 +5,4 @@ from dataclasses import dataclass
 @dataclass
 class Config:
     mongo_connection_string: str = ''
+    aon_base_url: str = 'https://2e.aonprd.com'  # point at aon_server.py for offline runs
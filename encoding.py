@@ -0,0 +1,62 @@
+import dataclasses
+from typing import Any, Dict, List, Type, TypeVar, get_type_hints, get_origin, get_args
+
+T = TypeVar('T')
+
+
+def field_default(f: dataclasses.Field) -> Any:
+    if f.default is not dataclasses.MISSING:
+        return f.default
+    if f.default_factory is not dataclasses.MISSING:
+        return f.default_factory()
+    return dataclasses.MISSING
+
+
+def encode_value(typ: Any, value: Any) -> Any:
+    if dataclasses.is_dataclass(typ) and isinstance(value, dict):
+        return encode_sparse(typ, value)
+    if get_origin(typ) in (list, List) and isinstance(value, list):
+        return [encode_value(get_args(typ)[0], v) for v in value]
+    if get_origin(typ) in (dict, Dict) and isinstance(value, dict):
+        return {k: encode_value(get_args(typ)[1], v) for k, v in value.items()}
+    return value
+
+
+# drop every field that still holds its default, as well as nested structures that end up empty
+# records are the dicts produced by dataclasses.asdict() for an instance of cls
+def encode_sparse(cls: Type, record: dict) -> dict:
+    hints = get_type_hints(cls)
+    sparse = {}
+    for f in dataclasses.fields(cls):
+        if f.name not in record:
+            continue
+        value = encode_value(hints[f.name], record[f.name])
+        default = field_default(f)
+        if dataclasses.is_dataclass(default):
+            default = {}  # a nested dataclass left at its defaults encodes to an empty dict
+        if value == default or value in ({}, []):
+            continue
+        sparse[f.name] = value
+    # keep anything that is not a field of cls (e.g. a mongo _id)
+    sparse.update({k: v for k, v in record.items() if k not in hints})
+    return sparse
+
+
+def decode_value(typ: Any, value: Any) -> Any:
+    if dataclasses.is_dataclass(typ) and isinstance(value, dict):
+        return decode_sparse(typ, value)
+    if get_origin(typ) in (list, List) and isinstance(value, list):
+        return [decode_value(get_args(typ)[0], v) for v in value]
+    if get_origin(typ) in (dict, Dict) and isinstance(value, dict):
+        key_type, value_type = get_args(typ)
+        # mongo only stores string keys, e.g. spell levels come back as '1' instead of 1
+        return {key_type(k) if key_type in (int, str) else k: decode_value(value_type, v) for k, v in value.items()}
+    return value
+
+
+# inverse of encode_sparse: missing fields are restored from the dataclass defaults
+# values that are not in their encoded form (e.g. trait names on normalized documents) are kept as they are
+def decode_sparse(cls: Type[T], record: dict) -> T:
+    hints = get_type_hints(cls)
+    return cls(**{f.name: decode_value(hints[f.name], record[f.name])
+                  for f in dataclasses.fields(cls) if f.name in record})
@@ -0,0 +1,76 @@
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Pattern, Tuple, Union
+
+from bs4 import NavigableString, Tag
+
+
+# a field starts at the first label_tag whose text is one of labels and collects every string up to a terminator
+# terminators are tag names, or (tag name, text) pairs such as ('b', 'Fort') to stop at the next label
+# the collected text (label included) is matched against pattern, and convert turns the match into the value
+# without a pattern, convert gets the text itself
+@dataclass
+class FieldSpec:
+    name: str
+    labels: Tuple[str, ...]
+    terminators: FrozenSet[Union[str, Tuple[str, str]]] = frozenset(['br', 'hr'])
+    pattern: Optional[Pattern] = None
+    convert: Callable[[Any], Any] = str
+    label_tag: str = 'b'
+    line_break: Optional[str] = None  # appended for every br when br is not a terminator
+    after: Optional[str] = None  # only start once this field has ended
+
+
+@dataclass
+class Extracted:
+    value: Any = None  # None when the pattern did not match
+    text: str = ''
+    end: Optional[Tag] = None  # the terminator that ended the field, None at the end of the document
+
+
+# resolve every spec in one walk over the elements following root
+# fields whose label never shows up are left out of the result
+def extract_fields(root: Tag, specs: List[FieldSpec]) -> Dict[str, Extracted]:
+    pending: Dict[Tuple[str, str], List[FieldSpec]] = {}
+    for spec in specs:
+        for label in spec.labels:
+            pending.setdefault((spec.label_tag, label), []).append(spec)
+    label_tags = {tag for tag, _ in pending} | {t[0] for s in specs for t in s.terminators if isinstance(t, tuple)}
+    active: Dict[str, Tuple[FieldSpec, List[str]]] = {}
+    results: Dict[str, Extracted] = {}
+
+    def finish(spec: FieldSpec, parts: List[str], end: Optional[Tag]):
+        text = ''.join(parts)
+        if spec.pattern:
+            match = spec.pattern.match(text)
+            value = spec.convert(match) if match else None
+        else:
+            value = spec.convert(text)
+        results[spec.name] = Extracted(value, text, end)
+
+    node = root
+    while node is not None and (pending or active):
+        if type(node) == NavigableString:
+            for _, parts in active.values():
+                parts.append(node)
+        elif isinstance(node, Tag):
+            text = node.get_text().strip() if node.name in label_tags else None
+            for name, (spec, parts) in list(active.items()):
+                if node.name in spec.terminators or (node.name, text) in spec.terminators:
+                    del active[name]
+                    finish(spec, parts, node)
+                elif node.name == 'br' and spec.line_break is not None:
+                    parts.append(spec.line_break)
+            for spec in pending.get((node.name, text), []) if text is not None else []:
+                if not spec.after or spec.after in results:
+                    active[spec.name] = (spec, [])
+                    # a field is only extracted once, from the first of its labels
+                    for label in spec.labels:
+                        key = (spec.label_tag, label)
+                        pending[key] = [s for s in pending[key] if s is not spec]
+                        if not pending[key]:
+                            del pending[key]
+        node = node.next
+
+    for spec, parts in active.values():
+        finish(spec, parts, None)
+    return results
@@ -0,0 +1,141 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, IO, List, Optional, Tuple
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# upper bounds in seconds, for per-page fetch times and per-type stage times
+BUCKETS: List[float] = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0]
+
+
+class Histogram:
+    def __init__(self):
+        self.counts: List[int] = [0] * len(BUCKETS)
+        self.count: int = 0
+        self.sum: float = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+
+# counters, histograms, json event lines and a rate-limited progress line on stderr
+# every method returns immediately when disabled (quiet, with no events or metrics file), which is the default
+class Metrics:
+    def __init__(self):
+        self.enabled: bool = False
+        self.show_progress: bool = False
+        self.progress_interval: float = 1.0
+        self.events: Optional[IO] = None
+        self.counters: Dict[Tuple[str, Labels], float] = defaultdict(float)
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = defaultdict(Histogram)
+        self.progress_state: Dict[str, Tuple[int, float, float]] = {}  # label -> (done, started, last printed)
+        self.lock = threading.Lock()
+
+    def configure(self, quiet: bool = False, events_path: str = None, collect: bool = False,
+                  progress_interval: float = 1.0):
+        self.show_progress = not quiet
+        self.progress_interval = progress_interval
+        if events_path:
+            self.events = open(events_path, 'a', encoding='utf-8')
+        self.enabled = self.show_progress or self.events is not None or collect
+
+    def close(self):
+        if self.events:
+            self.events.close()
+            self.events = None
+
+    def count(self, name: str, value: float = 1, **labels: str):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[(name, tuple(sorted(labels.items())))] += value
+
+    def observe(self, name: str, value: float, **labels: str):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.histograms[(name, tuple(sorted(labels.items())))].observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels: str):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def event(self, name: str, **fields):
+        if not self.events:
+            return
+        line = json.dumps(dict(time=time.time(), event=name, **fields), default=str)
+        with self.lock:
+            self.events.write(line + '\n')
+
+    # one more item of label is done; prints at most once per progress_interval
+    def progress(self, label: str, current: object = None):
+        if not self.show_progress:
+            return
+        now = time.perf_counter()
+        with self.lock:
+            done, started, printed = self.progress_state.get(label, (0, now, 0.0))
+            done += 1
+            self.progress_state[label] = (done, started, printed)
+            if now - printed < self.progress_interval:
+                return
+            self.progress_state[label] = (done, started, now)
+        rate = done / (now - started) if now > started else 0.0
+        sys.stderr.write('{}: {} done{}, {:.1f}/s\n'.format(
+            label, done, ' (at {})'.format(current) if current is not None else '', rate))
+
+    # prometheus text exposition format, for the node exporter textfile collector
+    def write_prometheus(self, path: str, prefix: str = 'aon_scraper_'):
+        lines: List[str] = []
+        with self.lock:
+            for name in sorted({n for n, _ in self.counters}):
+                lines.append('# TYPE {}{}_total counter'.format(prefix, name))
+                for (n, labels), value in sorted(self.counters.items()):
+                    if n == name:
+                        lines.append('{}{}_total{} {}'.format(prefix, name, format_labels(labels), value))
+            for name in sorted({n for n, _ in self.histograms}):
+                lines.append('# TYPE {}{} histogram'.format(prefix, name))
+                for (n, labels), h in sorted(self.histograms.items(), key=lambda x: x[0]):
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, c in zip(BUCKETS, h.counts):
+                        cumulative += c
+                        lines.append('{}{}_bucket{} {}'.format(prefix, name,
+                                                               format_labels(labels + (('le', str(bound)),)),
+                                                               cumulative))
+                    lines.append('{}{}_bucket{} {}'.format(prefix, name, format_labels(labels + (('le', '+Inf'),)),
+                                                           h.count))
+                    lines.append('{}{}_sum{} {}'.format(prefix, name, format_labels(labels), h.sum))
+                    lines.append('{}{}_count{} {}'.format(prefix, name, format_labels(labels), h.count))
+        # the textfile collector may read at any time, so replace the file in one step
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as outf:
+            outf.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    escaped = ((k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels)
+    return '{' + ','.join('{}="{}"'.format(k, v) for k, v in escaped) + '}'
+
+
+metrics = Metrics()
@@ -0,0 +1,53 @@
+import re
+
+# stat block patterns used by the creature parser
+# see regex_audit.py before changing any of these: every pattern has to stay linear on long ability text
+
+
+# one or more whitespace separated words made of the given characters (or regex alternatives)
+# unlike [chars\s]+ a string can only be split into words one way, so a neighbouring \s* or a required
+# terminator cannot make the engine retry every whitespace position
+def words(chars: str) -> str:
+    return r'(?:{0})+(?:\s+(?:{0})+)*'.format(chars)
+
+
+text_chars = r'[\w\-()\'’+.,]'
+# save notes end at the comma before the next save, so other commas may not be followed by Ref or Will
+save_note_chars = r'[\w\-\'+.]|\([^()]*\)|,(?!\s*(?:Ref|Will)\b)'
+
+ability_re = re.compile(r'\s*((?P<cost>(Single Action|Two Actions|Three Actions|Reaction|Free Action)+)\s*)?'
+                        r'(\((?P<traits>[\w, ]+)\)\s*)?'
+                        r'(Trigger\s*(?P<trigger>' + words(text_chars) + r')[.;]?\s*Effect\s*)?'
+                        r'(Requirements\s*(?P<requirements>' + words(text_chars) + r');\s*)?'
+                        r'(Effect\s*)?(?P<description>.*)\s*')
+strike_re = re.compile(r'\s*(?P<typ>Melee|Ranged)\s*'
+                       r'(?P<cost>SingleAction|TwoActions|ThreeActions)\s*'
+                       r'(?P<name>' + words(text_chars) + r')\s*'
+                       r'(?P<mod>[+\-]+\d+)\s*'
+                       r'(?P<multi>\[[+\-]+\d+/[+\-]+\d+\]\s*)?'
+                       r'(\((?P<traits>[\w, ]+)\)\s*)?'
+                       r'(,\s*Damage\s*(?P<damage>' + words(text_chars) + r')\s*)?'
+                       r'(,\s*Effect\s*(?P<effect>' + words(text_chars) + r')\s*)?')
+hp_re = re.compile(r'\s*HP\s*(?P<hp>[0-9]+);?\s*(?P<hp_notes>[\w\d\s\-()\'’+.,]*);?\s*')
+# split/sub/findall try every start position, (?<!...) skips the ones inside a run that a \s* would rescan
+hp_split_re = re.compile(r'(?<!\s)\s*HP [0-9]+[,;]+\s*')
+regen_re = re.compile(r'\s*[rR]egeneration (?P<regen>[0-9]+)\s*,?\s*\(?deactivated by\s*(?P<deactivated>[\w ]+)\)?\s*')
+hardness_re = re.compile(r'(?<!\s)\s*[hH]ardness (?P<hard>[0-9]+)')
+imm_pattern = re.compile(r'\s*(Immunities\s*(?P<imm>[\w\d\s\-(),\']*);?)?'
+                         r'\s*(Weaknesses\s*(?P<weak>[\w\d\s\-(),\']*);?)?'
+                         r'\s*(Resistances\s*(?P<res>[\w\d\s\-(),\']*);?)?')
+sense_re = re.compile(r'\s*Perception\s*(?P<per>[+-]?[0-9]+);?\s*(?P<per_notes>[\w\d\s\-()\'+.,]*)?\s*')
+language_re = re.compile(r'\s*Languages\s*(?P<langs>[\w\d\s\-()\'+.,]*);?\s*(?P<comms>[\w\d\s\-()\'+.,]*)?\s*')
+skills_re = re.compile(r'\s*Skills\s*(?P<skills>[\w\d\s\-()\'+.,]*)')
+# the whitespace after a skill name is only matched when there is a name, so it cannot overlap the leading \s*
+skill_re = re.compile(r'(?<![\w ])\s*(?P<name>(?:\w+(?: +\w+)*)?)(?:(?<=\w)\s*)?(?P<mod>[+-]+[0-9]+)\s*'
+                      r'(?P<notes>\([\w\d\s\-()\'+.,]*\))?\s*')
+abm_re = re.compile(r'\s*Str\s*(?P<str>[+-][0-9]+),\s*Dex\s*(?P<dex>[+-][0-9]+),\s*Con\s*(?P<con>[+-][0-9]+),'
+                    r'\s*Int\s*(?P<int>[+-][0-9]+),\s*Wis\s*(?P<wis>[+-][0-9]+),\s*Cha\s*(?P<cha>[+-][0-9]+)\s*')
+item_re = re.compile(r'\s*(?P<item>[\w\d\s\-()\'+.,]+),?\s*')
+ac_re = re.compile(r'\s*(?P<ac>[0-9]+)[;,]?\s*')
+ac_notes_re = re.compile(r'(?<!\s)\s*AC\s*[0-9]+\s*[;,]*')
+save_pattern = re.compile(r'\s*Fort\s*(?P<fort>[+\-][0-9]+)\s*(?P<fort_notes>(?:' + words(save_note_chars) + r')?),\s*'
+                          r'Ref\s*(?P<ref>[+\-][0-9]+)\s*(?P<ref_notes>(?:' + words(save_note_chars) + r')?),\s*'
+                          r'Will\s*(?P<will>[+\-][0-9]+)\s*(?P<will_notes>[\w\d\s\-()\'+.,]*);?'
+                          r'(?P<save_notes>[\w\d\s\-()\'+.,]*)?\s*')
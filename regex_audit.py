@@ -0,0 +1,122 @@
+import glob
+import os
+import random
+import re
+import sys
+import time
+from typing import Dict, Iterator, List, Pattern, Tuple
+
+import patterns
+
+# how the creature parser applies each pattern
+PATTERNS: Dict[str, Tuple[Pattern, str]] = {
+    'ability_re': (patterns.ability_re, 'match'),
+    'strike_re': (patterns.strike_re, 'match'),
+    'hp_re': (patterns.hp_re, 'match'),
+    'hp_split_re': (patterns.hp_split_re, 'split'),
+    'regen_re': (patterns.regen_re, 'match'),
+    'hardness_re': (patterns.hardness_re, 'sub'),
+    'imm_pattern': (patterns.imm_pattern, 'match'),
+    'sense_re': (patterns.sense_re, 'match'),
+    'language_re': (patterns.language_re, 'match'),
+    'skills_re': (patterns.skills_re, 'match'),
+    'skill_re': (patterns.skill_re, 'findall'),
+    'abm_re': (patterns.abm_re, 'match'),
+    'item_re': (patterns.item_re, 'findall'),
+    'ac_re': (patterns.ac_re, 'match'),
+    'ac_notes_re': (patterns.ac_notes_re, 'sub'),
+    'save_pattern': (patterns.save_pattern, 'match'),
+}
+
+# realistic line openings that lead each pattern into its repeated groups
+SEEDS: Dict[str, List[str]] = {
+    'ability_re': ['Reaction Trigger ', 'Two Actions (arcane, evocation) Requirements ', 'Trigger a creature '],
+    'strike_re': ['Melee SingleAction jaws ', 'Ranged TwoActions shortbow ',
+                  'Melee SingleAction claw +9 (agile), Damage '],
+    'hp_re': ['HP 45; ', 'HP 30, hardness 5; '],
+    'regen_re': ['regeneration 15 (deactivated by ', 'Regeneration 5, '],
+    'imm_pattern': ['Immunities ', 'Immunities fire; Weaknesses ', 'Weaknesses cold 5; Resistances '],
+    'sense_re': ['Perception +12; ', 'Perception +4 '],
+    'language_re': ['Languages Common, Draconic; ', 'Languages '],
+    'skills_re': ['Skills Acrobatics +10, '],
+    'skill_re': ['Acrobatics +10 (', 'Stealth '],
+    'abm_re': ['Str +4, Dex +2, Con +3, ', 'Str +1, '],
+    'save_pattern': ['Fort +12, Ref +10, Will +8; ', 'Fort +12 ', 'Fort +12, Ref +10 ', 'Fort +12 vs. poison, '],
+}
+FILLERS: List[str] = [' ', 'a ', 'a,', ', ', '+1 ', '(a) ', '. ', 'a.']
+TAILS: List[str] = ['', '!', '—']
+
+
+# best of a few runs, so that timer noise on fast patterns does not show up as growth
+def apply(pattern: Pattern, how: str, s: str, runs: int = 3) -> float:
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        if how == 'match':
+            pattern.match(s)
+        elif how == 'findall':
+            pattern.findall(s)
+        elif how == 'split':
+            pattern.split(s)
+        else:
+            pattern.sub('', s)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def adversarial_inputs(name: str, length: int, fuzz: int = 20) -> Iterator[str]:
+    pattern, _ = PATTERNS[name]
+    keywords = [w + ' ' for w in re.findall(r'[A-Z][a-z]+', pattern.pattern)]
+    for prefix in [''] + SEEDS.get(name, []) + keywords:
+        for filler in FILLERS:
+            for tail in TAILS:
+                yield prefix + filler * (length // len(filler)) + tail
+    rng = random.Random(name)
+    alphabet = FILLERS + keywords
+    for _ in range(fuzz):
+        s = ''
+        while len(s) < length:
+            s += rng.choice(alphabet)
+        yield s
+
+
+# text of every <br>/<hr> delimited line of the cached creature pages, tags stripped
+def corpus_inputs(data_dir: str) -> Iterator[str]:
+    for path in glob.glob(os.path.join(data_dir, 'creatures', '*.html')):
+        with open(path, 'r', encoding='utf8') as inf:
+            page = inf.read()
+        for line in re.split(r'<[bh]r\s*/?>', page):
+            text = re.sub(r'<[^>]+>', '', line).strip()
+            if text:
+                yield text
+
+
+def audit(data_dir: str = 'data', length: int = 2000) -> Dict[str, Dict[str, float]]:
+    corpus = list(corpus_inputs(data_dir))
+    report: Dict[str, Dict[str, float]] = {}
+    for name, (pattern, how) in PATTERNS.items():
+        # timing the same input at a quarter of the length shows how the worst case grows
+        worst, worst_small = 0.0, 0.0
+        for s, small in zip(adversarial_inputs(name, length), adversarial_inputs(name, length // 4)):
+            t = apply(pattern, how, s)
+            if t > worst:
+                worst, worst_small = t, apply(pattern, how, small)
+        corpus_worst = max((apply(pattern, how, s) for s in corpus), default=0.0)
+        report[name] = {
+            'adversarial': worst,
+            'growth': worst / worst_small if worst_small else 0.0,
+            'corpus': corpus_worst,
+        }
+    return report
+
+
+if __name__ == '__main__':
+    arg_data_dir = sys.argv[1] if len(sys.argv) >= 2 else 'data'
+    arg_length = int(sys.argv[2]) if len(sys.argv) >= 3 else 2000
+    results = audit(arg_data_dir, arg_length)
+    # linear patterns grow ~4x when the input grows 4x, quadratic ~16x, cubic ~64x
+    print('{:<14}{:>16}{:>10}{:>14}'.format('pattern', 'adversarial ms', 'growth', 'corpus ms'))
+    for pattern_name, r in sorted(results.items(), key=lambda x: -x[1]['adversarial']):
+        flag = '  SUPERLINEAR' if r['growth'] > 8 else ''
+        print('{:<14}{:>16.3f}{:>10.1f}{:>14.3f}{}'.format(pattern_name, r['adversarial'] * 1000, r['growth'],
+                                                           r['corpus'] * 1000, flag))
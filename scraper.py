@@ -1,8 +1,12 @@
+import argparse
 import dataclasses
+import mmap
 import os
 import sys
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
 from enum import Enum
-from typing import List, Optional, Tuple, Match, Any, Union
+from typing import List, Optional, Tuple, Match, Any, Union, Dict, Callable, Iterable, Iterator
 from urllib.error import HTTPError
 from bs4 import BeautifulSoup, NavigableString, Tag
 import urllib.request as fetch
@@ -10,9 +14,17 @@ from pymongo import MongoClient
 import re
 
 from ancestry import Ancestry, AncestryHeader
+from changes import compute_changes, save_changes
+from classify import PageKind, classify_page
 from creature import Creature, Header, Action, Sidebar, Strike
+from encoding import encode_sparse, decode_sparse
+from extract import FieldSpec, extract_fields
+from metrics import metrics
+from patterns import ability_re, strike_re, hp_re, hp_split_re, regen_re, hardness_re, imm_pattern, sense_re, \
+    language_re, skills_re, skill_re, abm_re, item_re, ac_re, ac_notes_re, save_pattern
+from shard import parse_shard, shard_ids, write_partial, merge_partials
 from source import Source
-from trait import Trait
+from trait import Trait, intern_traits, resolve_traits
 from local_config import config
 
 
@@ -25,47 +37,94 @@ class GameType(Enum):
 
 
 # includes empty strings for bad pages on AoN
-def fetch_pages(typ: GameType, cache_only: bool = None) -> Optional[List[str]]:
-    pages: List[str] = []
+# ids that failed with an http error other than 404 (missing ids are expected) are appended to failed
+def fetch_page(typ: GameType, m_id: int, cache_only: bool = None, failed: List[int] = None) -> Optional[str]:
+    fetch_url, data_path, _ = get_fetch_params(typ)
+    metrics.progress('fetching {}'.format(typ.value), m_id)
+    if os.path.exists(data_path.format(m_id)):
+        metrics.count('pages_fetched', type=typ.value, source='cache')
+        with open(data_path.format(m_id), 'r', encoding='utf8') as inf:
+            return inf.read()
+    elif cache_only:
+        metrics.count('pages_missing', type=typ.value)
+        return ''
+    try:
+        with metrics.timer('fetch_seconds', type=typ.value), fetch.urlopen(fetch_url.format(m_id)) as res:
+            s = res.read()
+        metrics.count('pages_fetched', type=typ.value, source='aon')
+        if s:
+            with open(data_path.format(m_id), 'wb') as outf:
+                outf.write(s)
+            return s
+        else:
+            return None  # TODO USE CACHE HERE
+    except HTTPError as e:
+        metrics.count('fetch_errors', type=typ.value, status=str(e.code))
+        metrics.event('fetch_error', type=typ.value, id=m_id, status=e.code)
+        if failed is not None and e.code != 404:
+            failed.append(m_id)
+        return ''
+
+
+# index pages (family table, trait groups) are cached like the entry pages, in data/index
+# live runs always fetch them (and refresh the cache), only cache_only runs read the cached copy
+def fetch_index(path: str, data_path: str, cache_only: bool = None) -> bytes:
+    if cache_only and os.path.exists(data_path):
+        with open(data_path, 'rb') as inf:
+            return inf.read()
+    with fetch.urlopen(config.aon_base_url + path) as res:
+        s = res.read()
+    if s:
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        with open(data_path, 'wb') as outf:
+            outf.write(s)
+    return s
+
+
+# url, cache path and (exclusive) max id of the pages for each implemented GameType
+def get_fetch_params(typ: GameType) -> Optional[Tuple[str, str, int]]:
     if typ == GameType.CREATURE:
-        fetch_url: str = 'https://2e.aonprd.com/Monsters.aspx?id={}'
-        data_path: str = 'data/creatures/{}.html'
-        max_id: int = 982
+        return config.aon_base_url + '/Monsters.aspx?id={}', 'data/creatures/{}.html', 982
     elif typ == GameType.TRAIT:
-        fetch_url: str = 'https://2e.aonprd.com/Traits.aspx?id={}'
-        data_path: str = 'data/traits/{}.html'
-        max_id: int = 316
+        return config.aon_base_url + '/Traits.aspx?id={}', 'data/traits/{}.html', 316
     elif typ == GameType.ANCESTRY:
-        fetch_url: str = 'https://2e.aonprd.com/Ancestries.aspx?id={}'
-        data_path: str = 'data/ancestries/{}.html'
-        max_id: int = 22
-    else:
+        return config.aon_base_url + '/Ancestries.aspx?id={}', 'data/ancestries/{}.html', 22
+    return None
+
+
+# pool is an optional executor shared between GameTypes so that concurrent scrapes draw from one set of fetch workers
+# ids restricts the fetch to some of the ids of typ (e.g. one shard), failed collects the ids that could not be fetched
+def fetch_pages(typ: GameType, cache_only: bool = None, pool: Executor = None,
+                ids: Iterable[int] = None, failed: List[int] = None) -> Optional[List[Tuple[int, str]]]:
+    params = get_fetch_params(typ)
+    if not params:
         return None
+    _, _, max_id = params
 
     print('Fetching {}'.format(typ))
-    for m_id in range(1, max_id):
-        if os.path.exists(data_path.format(m_id)):
-            print('found cached {}'.format(m_id))
-            with open(data_path.format(m_id), 'r', encoding='utf8') as inf:
-                pages.append(inf.read())
-        elif cache_only:
-            print('appending empty string to id {} (for enumeration purposes)'.format(m_id))
-            pages.append('')
-        elif not cache_only:
-            print('fetching {}'.format(m_id))
-            try:
-                with fetch.urlopen(fetch_url.format(m_id)) as res:
-                    s = res.read()
-                    if s:
-                        pages.append(s)
-                        with open(data_path.format(m_id), 'wb') as outf:
-                            outf.write(s)
-                    else:
-                        pass  # TODO USE CACHE HERE
-            except HTTPError:
-                print('ERROR fetching {}'.format(m_id))
-                pages.append('')
-    return pages
+    ids = list(ids) if ids is not None else range(1, max_id)
+    fetched = (pool.map if pool else map)(lambda m_id: fetch_page(typ, m_id, cache_only, failed), ids)
+    return [(m_id, page) for m_id, page in zip(ids, fetched) if page is not None]
+
+
+# lazily yields (id, page) for the cached pages of typ, skipping ids that are not cached
+# each page is memory-mapped and unmapped once the consumer moves on, so only one page is held at a time
+# (BeautifulSoup reads the mapping like a file)
+def iter_cached_pages(typ: GameType, ids: Iterable[int] = None) -> Iterator[Tuple[int, Union[mmap.mmap, str]]]:
+    params = get_fetch_params(typ)
+    if not params:
+        return
+    _, data_path, max_id = params
+    for m_id in ids if ids is not None else range(1, max_id):
+        try:
+            with open(data_path.format(m_id), 'rb') as inf:
+                if os.fstat(inf.fileno()).st_size == 0:
+                    yield m_id, ''  # mmap cannot map an empty file
+                    continue
+                with mmap.mmap(inf.fileno(), 0, access=mmap.ACCESS_READ) as page:
+                    yield m_id, page
+        except FileNotFoundError:
+            continue
 
 
 def get_abilities(start_tag: Tag) -> Tuple[List[Action], Tag]:
@@ -97,11 +156,6 @@ def get_abilities(start_tag: Tag) -> Tuple[List[Action], Tag]:
             inter_str = ''
         ability_tag = ability_tag.next
 
-    ability_re = re.compile(r'\s*((?P<cost>(Single Action|Two Actions|Three Actions|Reaction|Free Action)+)\s*)?'
-                            r'(\((?P<traits>[\w, ]+)\)\s*)?'
-                            r'(Trigger\s*(?P<trigger>[\w\d\s\-()\'’+.,]+)[.;]?\s*Effect\s*)?'
-                            r'(Requirements\s*(?P<requirements>[\w\d\s\-()\'’+.,]+);\s*)?'
-                            r'(Effect\s*)?(?P<description>.*)\s*')
     for (name, descr) in zip(name_arr, descr_arr):
         if name == 'Items':
             continue
@@ -127,14 +181,6 @@ def get_strikes(start_tag: Tag) -> Tuple[List[Action], Tag]:
     tag = start_tag  # assumed start at the 'b' Speed tag
     active_entries: Optional[List[Tag]] = tag.previous.find_all_next('span', class_=['hanging-indent'])
     strike_str = ''
-    strike_re = re.compile(r'\s*(?P<typ>Melee|Ranged)\s*'
-                           r'(?P<cost>SingleAction|TwoActions|ThreeActions)\s*'
-                           r'(?P<name>[\w\d\s\-()\'’+.,]+)\s*'
-                           r'(?P<mod>[+\-]+\d+)\s*'
-                           r'(?P<multi>\[[+\-]+\d+/[+\-]+\d+\]\s*)?'
-                           r'(\((?P<traits>[\w, ]+)\)\s*)?'
-                           r'(,\s*Damage\s*(?P<damage>[\w\d\s\-()\'’+.,]+)\s*)?'
-                           r'(,\s*Effect\s*(?P<effect>[\w\d\s\-()\'’+.,]+)\s*)?')
     for entry in active_entries:
         strike_str = ''.join([x.string for x in entry.children if not x.name])
         match = re.match(strike_re, strike_str)
@@ -158,13 +204,44 @@ def get_sidebars(start_tag: Tag) -> Tuple[List[Sidebar], Tag]:
     return sidebars, tag
 
 
-def parse_creatures(pages: List[str]) -> Optional[List[object]]:
+def parse_items(text: str) -> List[str]:
+    item_matches = re.findall(item_re, text.replace('Items', '', 1))
+    return [x.strip() for x in item_matches if x.strip()]
+
+
+def parse_ac(text: str) -> Tuple[int, str]:
+    ac_match = re.match(ac_re, text.split('AC', 1)[-1])
+    return int(ac_match.group('ac')) if ac_match else 0, re.sub(ac_notes_re, '', text).strip()
+
+
+# the labelled lines of a creature stat block, each ending at the next br/hr unless stated otherwise
+CREATURE_FIELDS: List[FieldSpec] = [
+    FieldSpec('perception', ('Perception',), pattern=sense_re,
+              convert=lambda m: (int(m.group('per')), [x.strip() for x in m.group('per_notes').split(',')])),
+    FieldSpec('languages', ('Languages',), pattern=language_re,
+              convert=lambda m: ([x.strip() for x in m.group('langs').split(',')],
+                                 [x.strip() for x in m.group('comms').split(',')])),
+    FieldSpec('skills', ('Skills',), pattern=skills_re,
+              convert=lambda m: [Header(s.group('name'), s.group('notes'), int(s.group('mod')))
+                                 for s in re.finditer(skill_re, m.group('skills'))]),
+    FieldSpec('abilityMods', ('Str',), pattern=abm_re, convert=lambda m: [int(x) for x in m.groups()]),
+    FieldSpec('items', ('Items',), convert=parse_items, after='abilityMods'),
+    FieldSpec('ac', ('AC',), frozenset(['br', 'hr', ('b', 'Fort')]), convert=parse_ac),
+    FieldSpec('saves', ('Fort',), pattern=save_pattern, convert=lambda m: m.groupdict()),
+    FieldSpec('hitPoints', ('HP',), pattern=hp_re, convert=lambda m: (int(m.group('hp')), m.group('hp_notes'))),
+    FieldSpec('immunities', ('Immunities', 'Weaknesses', 'Resistances'), pattern=imm_pattern,
+              convert=lambda m: tuple([x.strip() for x in m.group(g).split(',')] if m.group(g) else []
+                                      for g in ('imm', 'weak', 'res'))),
+    FieldSpec('speed', ('Speed',), convert=lambda text: text.replace('Speed', '', 1), after='hitPoints'),
+]
+
+
+def parse_creatures(pages: Iterable[Tuple[int, Any]], cache_only: bool = None) -> Optional[List[object]]:
     # parse the families of creatures from http://2e.aonprd.com/Monsters.aspx?Letter=All
     try:
-        with fetch.urlopen('http://2e.aonprd.com/Monsters.aspx?Letter=All') as inf:
-            fam_page = inf.read()
-            if not fam_page:
-                raise ValueError('unable to fetch families table from AoN')
+        fam_page = fetch_index('/Monsters.aspx?Letter=All', 'data/index/monsters.html', cache_only)
+        if not fam_page:
+            raise ValueError('unable to fetch families table from AoN')
     except Exception:
         print('error fetching family table')
         sys.exit(1)
@@ -180,15 +257,17 @@ def parse_creatures(pages: List[str]) -> Optional[List[object]]:
             fams[fam] = [name]
 
     creatures: List[object] = []
-    for ind, page in enumerate(pages):
-        if page == '':
-            continue  # placeholder to properly ennumerate "bad" array items
-        print('parsing id={}\tof\t{}'.format(ind + 1, len(pages)))
+    for m_id, page in pages:
+        kind = classify_page(page).kind
+        if kind != PageKind.CREATURE:
+            metrics.count('pages_skipped', type=GameType.CREATURE.value, kind=kind.value)
+            continue  # bad or missing page on AoN
+        metrics.progress('parsing creature', m_id)
         creature: Creature = Creature()
         main_tag = BeautifulSoup(page, 'html.parser').find('span', id='ctl00_MainContent_DetailedOutput')
 
         # id/name/level
-        creature.id = ind + 1
+        creature.id = m_id
         creature.name = str(main_tag.h1.string)
         creature.level = main_tag.find('span', text=re.compile('Creature -?[0-9]+')).text.split()[1]
 
@@ -199,33 +278,14 @@ def parse_creatures(pages: List[str]) -> Optional[List[object]]:
         creature.source.book = src[0]
         creature.source.page = int(src[1])
 
-        # HP TODO REWORK THE WHOLE SECTION
-        hp_tag = main_tag
-        hp_re = re.compile(r'\s*HP\s*(?P<hp>[0-9]+);?\s*(?P<hp_notes>[\w\d\s\-()\'’+.,]*);?\s*')
-        while hp_tag.next:
-            if hp_tag.name and hp_tag.name == 'b' and hp_tag.text == 'HP':
-                break
-            hp_tag = hp_tag.next
-
-        hp_str = ''
-        while hp_tag.next:
-            if hp_tag.name == 'br' or hp_tag.name == 'hr':
-                # or (hp_tag.name == 'b' and hp_tag.string in ['Immunities', 'Resistances', 'Weaknesses']):
-                break
-            if type(hp_tag) == NavigableString:
-                hp_str = ''.join((hp_str, hp_tag.string))
-            hp_tag = hp_tag.next
+        # every labelled line of the stat block, resolved in one pass (see CREATURE_FIELDS)
+        fields = extract_fields(main_tag, CREATURE_FIELDS)
 
-        hp_match = re.match(hp_re, hp_str)
-        creature.hitPoints = int(hp_match.groupdict().get('hp'))
-        creature.hitPointsNotes = hp_match.groupdict().get('hp_notes')
-
-        regen_re = re.compile(
-            r'\s*[rR]egeneration (?P<regen>[0-9]+)\s*,?\s*\(?deactivated by\s*(?P<deactivated>[\w ]+)\)?\s*')
-        hardness_re = re.compile(r'\s*[hH]ardness (?P<hard>[0-9]+)')
+        # HP
+        creature.hitPoints, creature.hitPointsNotes = fields['hitPoints'].value
         if creature.hitPointsNotes:
             creature.hitPointsNotes = ''.join(
-                re.split(re.compile(r'\s*HP [0-9]+[,;]+\s*'), creature.hitPointsNotes)[1:]).strip(' ;,')
+                re.split(hp_split_re, creature.hitPointsNotes)[1:]).strip(' ;,')
             regen_match: Match = re.match(regen_re, creature.hitPointsNotes)
             if regen_match:
                 creature.regeneration = int(regen_match.group('regen'))
@@ -236,20 +296,8 @@ def parse_creatures(pages: List[str]) -> Optional[List[object]]:
                 creature.hitPointsNotes = re.sub(hardness_re, '', creature.hitPointsNotes)
 
         # Immunities; Weaknesses; Resistances
-        imm_pattern = re.compile(
-            r'\s*(Immunities\s*(?P<imm>[\w\d\s\-(),\']*);?)?\s*(Weaknesses\s*(?P<weak>[\w\d\s\-(),\']*);?)?\s*(Resistances\s*(?P<res>[\w\d\s\-(),\']*);?)?')
-        imm_str = ''
-        while hp_tag.next:
-            if hp_tag.name == 'br' or hp_tag.name == 'hr':
-                break
-            if type(hp_tag) == NavigableString:
-                imm_str = ''.join([imm_str, hp_tag.string])
-            hp_tag = hp_tag.next
-
-        imm_match = re.match(imm_pattern, imm_str)
-        creature.immunities = [x.strip() for x in imm_match.group('imm').split(',')] if imm_match.group('imm') else []
-        creature.weaknesses = [x.strip() for x in imm_match.group('weak').split(',')] if imm_match.group('weak') else []
-        creature.resistances = [x.strip() for x in imm_match.group('res').split(',')] if imm_match.group('res') else []
+        if fields.get('immunities') and fields['immunities'].value:
+            creature.immunities, creature.weaknesses, creature.resistances = fields['immunities'].value
 
         # Traits
         trait_tag = main_tag
@@ -276,162 +324,53 @@ def parse_creatures(pages: List[str]) -> Optional[List[object]]:
             trait_tag = trait_tag.next
 
         # Perception and senses
-        sense_tag = trait_tag
-        sense_str = ''
-        sense_re = re.compile(r'\s*Perception\s*(?P<per>[+-]?[0-9]+);?\s*(?P<per_notes>[\w\d\s\-()\'+.,]*)?\s*')
-        while sense_tag.next:
-            if sense_tag.name == 'b' and sense_tag.string == 'Perception':
-                break
-            sense_tag = sense_tag.next
-        while sense_tag.next:
-            if sense_tag.name == 'br' or sense_tag.name == 'hr':
-                break
-            elif type(sense_tag) == NavigableString:
-                sense_str = ''.join((sense_str, sense_tag.string))
-            sense_tag = sense_tag.next
-
-        sense_match = re.match(sense_re, sense_str)
-        creature.perception = int(sense_match.group('per'))
-        creature.senses = [x.strip() for x in sense_match.group('per_notes').split(',')]
+        creature.perception, creature.senses = fields['perception'].value
 
         # languages
-        language_tag = sense_tag.find_next('b', text='Languages')
-        language_re = re.compile(r'\s*Languages\s*(?P<langs>[\w\d\s\-()\'+.,]*);?\s*(?P<comms>[\w\d\s\-()\'+.,]*)?\s*')
-        if language_tag:
-            language_str = ''
-            while language_tag.next:
-                if language_tag.name == 'br' or language_tag.name == 'hr':
-                    break
-                elif type(language_tag) == NavigableString:
-                    language_str = ''.join((language_str, language_tag.string))
-                language_tag = language_tag.next
-
-            language_match = re.match(language_re, language_str)
-            creature.languages = [x.strip() for x in language_match.group('langs').split(',')]
-            creature.otherCommunication = [x.strip() for x in language_match.group('comms').split(',')]
+        if fields.get('languages') and fields['languages'].value:
+            creature.languages, creature.otherCommunication = fields['languages'].value
 
         # skills
-        skill_tag = sense_tag.find_next('b', text='Skills')
-        skills_re = re.compile(r'\s*Skills\s*(?P<skills>[\w\d\s\-()\'+.,]*)')
-        skill_re = re.compile(r'(?P<name>[\w ]*)\s*(?P<mod>[+-]+[0-9]+)\s*(?P<notes>\([\w\d\s\-()\'+.,]*\))?\s*')
-        if skill_tag:
-            skill_str = ''
-            while skill_tag.next:
-                if skill_tag.name == 'br' or skill_tag.name == 'hr':
-                    break
-                elif type(skill_tag) == NavigableString:
-                    skill_str = ''.join((skill_str, skill_tag.string))
-                skill_tag = skill_tag.next
-
-            skill_match = re.match(skills_re, skill_str)
-            for s in re.finditer(skill_re, skill_match.group('skills')):
-                skill = Header(s.group('name'), s.group('notes'), int(s.group('mod')))
-                creature.skills.append(skill)
+        if fields.get('skills') and fields['skills'].value:
+            creature.skills = fields['skills'].value
 
         # ability mods
-        abm_tag = main_tag
-        abm_str = ''
-        abm_re = re.compile(
-            r'\s*Str\s*(?P<str>[+-][0-9]+),\s*Dex\s*(?P<dex>[+-][0-9]+),\s*Con\s*(?P<con>[+-][0-9]+),\s*Int\s*(?P<int>[+-][0-9]+),\s*Wis\s*(?P<wis>[+-][0-9]+),\s*Cha\s*(?P<cha>[+-][0-9]+)\s*')
-        while abm_tag.next:
-            if abm_tag.name == 'b' and abm_tag.string == 'Str':
-                break
-            abm_tag = abm_tag.next
-
-        while abm_tag.next:
-            if abm_tag.name == 'br' or abm_tag.name == 'hr':
-                break
-            elif type(abm_tag) == NavigableString:
-                abm_str = ''.join((abm_str, abm_tag.string))
-            abm_tag = abm_tag.next
-
-        abmods = re.match(abm_re, abm_str)
-        creature.abilityMods = [int(x) for x in abmods.groups()]
+        creature.abilityMods = fields['abilityMods'].value
 
         # items
         # (for some reason these are listed in the template as ABOVE interaction abilities, but are often NOT)
-        item_tag = abm_tag
-        item_str = ''
-        item_re = re.compile(r'\s*(?P<item>[\w\d\s\-()\'+.,]+),?\s*')
-        while item_tag.next:
-            if item_tag.name == 'b' and item_tag.string == 'Items':
-                break
-            item_tag = item_tag.next
-
-        while item_tag.next:
-            if item_tag.name == 'br' or item_tag.name == 'hr':
-                break
-            elif type(item_tag) == NavigableString:
-                item_str = ''.join((item_str, item_tag.string))
-            item_tag = item_tag.next
-
-        if item_str:
-            item_str = item_str.replace('Items', '', 1)
-            item_matches = re.findall(item_re, item_str)
-            creature.items = [x.strip() for x in item_matches if x.strip()]
+        if fields.get('items'):
+            creature.items = fields['items'].value
 
         # interaction abilities
-        creature.interactionAbilities, _ = get_abilities(abm_tag)
-
-        # AC
-        ac_tag = main_tag
-        while ac_tag.next and not creature.ac:
-            if ac_tag.name and ac_tag.name == 'b' and ac_tag.text == 'AC' and type(ac_tag.next) == NavigableString:
-                creature.ac = int(
-                    re.match(re.compile(r'\s*(?P<ac>[0-9]+)[;,]?\s*'), ac_tag.next_sibling.string).group('ac'))
-            ac_tag = ac_tag.next
-
-        # AC notes, iterate until saves
-        while ac_tag.next:
-            if ac_tag.name == 'b' and ac_tag.text == 'Fort':
-                break
-            elif not ac_tag.name:
-                creature.acNotes = ''.join([creature.acNotes, ac_tag.string])
-            ac_tag = ac_tag.next
-
-        if creature.acNotes:
-            creature.acNotes = re.sub(re.compile(r'\s*AC\s*[0-9]+\s*[;,]*'), '', creature.acNotes).strip()
-        # iterate through the whole row until hr/br, then parse the resulting string for saves and notes
-        save_pattern = re.compile(r'\s*Fort\s*(?P<fort>[+\-][0-9]+)\s*(?P<fort_notes>[\w\d\s\-()\'+.,]*),\s*'
-                                  r'Ref\s*(?P<ref>[+\-][0-9]+)\s*(?P<ref_notes>[\w\d\s\-()\'+.,]*),\s*'
-                                  r'Will\s*(?P<will>[+\-][0-9]+)\s*(?P<will_notes>[\w\d\s\-()\'+.,]*);?'
-                                  r'(?P<save_notes>[\w\d\s\-()\'+.,]*)?\s*')
-        saves_str = ''
-        while ac_tag.next:
-            if ac_tag.name == 'hr' or ac_tag.name == 'br':
-                break
-            if type(ac_tag) == NavigableString:
-                saves_str = ''.join([saves_str, ac_tag.string])
-            ac_tag = ac_tag.next
+        creature.interactionAbilities, _ = get_abilities(fields['abilityMods'].end)
 
-        saves_match = re.match(save_pattern, saves_str)
+        # AC and AC notes (up to the saves)
+        creature.ac, creature.acNotes = fields['ac'].value
 
-        creature.fortitude = int(saves_match.group('fort'))
-        creature.fortitudeNotes = saves_match.group('fort_notes')
-        creature.reflex = int(saves_match.group('ref'))
-        creature.reflexNotes = saves_match.group('ref_notes')
-        creature.will = int(saves_match.group('will'))
-        creature.willNotes = saves_match.group('will_notes')
-        creature.saveNotes = saves_match.group('save_notes')
+        # saves
+        saves = fields['saves'].value
+        if saves is None:
+            # one unusual save line should not abort the whole run
+            print('could not parse the saves of creature {}, skipping it'.format(m_id))
+            metrics.count('pages_skipped', type=GameType.CREATURE.value, kind='unparsed saves')
+            continue
+        creature.fortitude = int(saves['fort'])
+        creature.fortitudeNotes = saves['fort_notes']
+        creature.reflex = int(saves['ref'])
+        creature.reflexNotes = saves['ref_notes']
+        creature.will = int(saves['will'])
+        creature.willNotes = saves['will_notes']
+        creature.saveNotes = saves['save_notes']
 
         # automatic abilities
-        creature.automaticAbilities, _ = get_abilities(hp_tag)
+        creature.automaticAbilities, _ = get_abilities(fields['hitPoints'].end)
 
         # speed
-        speed_tag = hp_tag.next
-        speed_str = ''
-        while speed_tag.next:
-            if speed_tag.name == 'b' and speed_tag.string == 'Speed':
-                break
-            speed_tag = speed_tag.next
-        while speed_tag.next and speed_tag.name != 'hr' and speed_tag.name != 'br':
-            if type(speed_tag) == NavigableString and speed_tag.string.strip() != 'Speed':
-                speed_str = ''.join((speed_str, speed_tag.string))
-            speed_tag = speed_tag.next
-        creature.speed = speed_str
+        creature.speed = fields['speed'].value
 
         # offensive/proactive abilities
-        action_tag: Tag = speed_tag.next
+        action_tag: Tag = fields['speed'].end.next
         creature.strikes, action_tag = get_strikes(action_tag)
         creature, action_tag = get_spells(creature, action_tag)
         creature.activeAbilities, action_tag = get_abilities(action_tag)
@@ -447,17 +386,19 @@ def parse_creatures(pages: List[str]) -> Optional[List[object]]:
     return creatures
 
 
-def parse_traits(pages: List[str]) -> Optional[List[object]]:
+def parse_traits(pages: Iterable[Tuple[int, Any]], cache_only: bool = None) -> Optional[List[object]]:
     traits: List[Any] = []
-    for ind, page in enumerate(pages):
-        if page == '':
-            continue  # placeholder to properly enumerate "bad" array items
-        print('parsing id={}\tof\t{}'.format(ind + 1, len(pages)))
+    for m_id, page in pages:
+        kind = classify_page(page).kind
+        if kind in [PageKind.EMPTY, PageKind.NOT_FOUND]:
+            metrics.count('pages_skipped', type=GameType.TRAIT.value, kind=kind.value)
+            continue  # bad or missing page on AoN
+        metrics.progress('parsing trait', m_id)
         trait = Trait()
         whole_text = BeautifulSoup(page, 'html.parser').find('span', {'id': 'ctl00_MainContent_DetailedOutput'})
 
         # get name
-        trait.id = ind + 1
+        trait.id = m_id
         trait.name = str(whole_text.h1.string)
 
         # get description
@@ -481,11 +422,8 @@ def parse_traits(pages: List[str]) -> Optional[List[object]]:
         traits.append(dataclasses.asdict(trait))
 
     # now we put them in the groups defined on https://2e.aonprd.com/Traits.aspx
-    with fetch.urlopen('http://2e.aonprd.com/Traits.aspx') as res:
-        if not res:
-            raise HTTPError
-        s = res.read()
-        traits_main_page = BeautifulSoup(s, 'html.parser').find('span', id='ctl00_MainContent_DetailedOutput')
+    s = fetch_index('/Traits.aspx', 'data/index/traits.html', cache_only)
+    traits_main_page = BeautifulSoup(s, 'html.parser').find('span', id='ctl00_MainContent_DetailedOutput')
     d_node = traits_main_page
     group_label = ''
     while d_node:
@@ -508,13 +446,39 @@ def parse_table_into_list(tag: Tag) -> List[List[str]]:
     return table
 
 
-def parse_ancestries(pages: List[str]) -> Optional[List[object]]:
+def strip_label(label: str) -> Callable[[str], str]:
+    return lambda text: text.replace(label, '', 1).strip()
+
+
+def label_lines(label: str) -> Callable[[str], List[str]]:
+    return lambda text: [line.strip() for line in text.replace(label, '', 1).split('\n') if line.strip()]
+
+
+# the h2 headed sections of an ancestry page that follow its description
+ANCESTRY_FIELDS: List[FieldSpec] = [
+    FieldSpec('hitPoints', ('Hit Points',), frozenset(['h2', 'br']), convert=strip_label('Hit Points'), label_tag='h2'),
+    FieldSpec('size', ('Size',), frozenset(['h2', 'br']), convert=strip_label('Size'), label_tag='h2'),
+    FieldSpec('speed', ('Speed',), frozenset(['h2', 'br']), convert=strip_label('Speed'), label_tag='h2'),
+    FieldSpec('abilityBoosts', ('Ability Boosts',), frozenset(['h2']), convert=label_lines('Ability Boosts'),
+              label_tag='h2', line_break='\n'),
+    FieldSpec('abilityFlaws', ('Ability Flaw(s)',), frozenset(['h2']), convert=label_lines('Ability Flaw(s)'),
+              label_tag='h2', line_break='\n'),
+    FieldSpec('languages', ('Languages',), frozenset(['h2']), convert=label_lines('Languages'),
+              label_tag='h2', line_break='\n'),
+]
+
+
+def parse_ancestries(pages: Iterable[Tuple[int, Any]], cache_only: bool = None) -> Optional[List[object]]:
     ancestries: List[Ancestry] = []
-    for ind, page in enumerate(pages):
-        if page == '':
-            continue  # placeholder to properly enumerate "bad" array items
+    for m_id, page in pages:
+        # heritages are listed under the same ids, but we only parse ancestries
+        kind = classify_page(page).kind
+        if kind != PageKind.ENTRY:
+            metrics.count('pages_skipped', type=GameType.ANCESTRY.value, kind=kind.value)
+            continue
+        metrics.progress('parsing ancestry', m_id)
         anc: Ancestry = Ancestry()
-        anc.id = ind + 1
+        anc.id = m_id
         whole_text = BeautifulSoup(page, 'html5lib').find('span', {'id': 'ctl00_MainContent_DetailedOutput'})
 
         # get name
@@ -523,10 +487,6 @@ def parse_ancestries(pages: List[str]) -> Optional[List[object]]:
             if m.string:
                 anc.name = ''.join((anc.name, m.string))
 
-        # if this is just a heritage, we don't parse it
-        if 'Heritage' in anc.name:
-            continue
-
         # get rarity and traits
         uncommon: Tag = whole_text.find_next(class_='traituncommon')
         rare: Tag = whole_text.find_next(class_='traitrare')
@@ -565,48 +525,15 @@ def parse_ancestries(pages: List[str]) -> Optional[List[object]]:
         anc.description = d_entries
 
         # Hit Points, Size, Speed, Ability Boosts (Flaws), Languages, Senses, Extra(s)
-        # usually in that order (?)
-        # then break when m_tag == m_tag.find_next(name='div', class_='clear').previous.previous.previous
-        d_str = ''
-        anc.hitPoints = str(m_tag.find_next(name='h2', text='Hit Points').next.next)
-        anc.size = str(m_tag.find_next(name='h2', text='Size').next.next)
-        anc.speed = str(m_tag.find_next(name='h2', text='Speed').next.next)
-        boosts_tag = m_tag.find_next(name='h2', text='Ability Boosts').next.next
-        while boosts_tag.next:
-            if boosts_tag.name and boosts_tag.name == 'h2':
-                break
-            if type(boosts_tag) == NavigableString:
-                d_str = ''.join((d_str, boosts_tag.string))
-            elif boosts_tag.name == 'br':
-                d_str = ''.join((d_str, '\n'))
-            boosts_tag = boosts_tag.next
-        anc.abilityBoosts = [d for d in d_str.split('\n') if d]
-        flaws_tag = m_tag.find_next(name='h2', text='Ability Flaw(s)')
-        if flaws_tag:
-            d_str = ''  # reset
-            flaws_tag = flaws_tag.next.next
-            while flaws_tag.next:
-                if flaws_tag.name and flaws_tag.name == 'h2':
-                    break
-                if type(flaws_tag) == NavigableString:
-                    d_str = ''.join((d_str, flaws_tag.string))
-                elif flaws_tag.name == 'br':
-                    d_str = ''.join((d_str, '\n'))
-                flaws_tag = flaws_tag.next
-            anc.abilityFlaws = [d for d in d_str.split('\n') if d]
-
-        lang_tag = m_tag.find_next(name='h2', text='Languages').next_sibling
-        d_str = ''
-        while lang_tag.next:
-            if lang_tag.name and lang_tag.name == 'h2':
-                anc.languages.append(d_str)
-                break
-            if type(lang_tag) == NavigableString:
-                d_str = ''.join((d_str, lang_tag.string))
-            elif lang_tag.name == 'br':
-                anc.languages.append(d_str)
-                d_str = ''
-            lang_tag = lang_tag.next
+        # usually in that order (?), resolved in one pass (see ANCESTRY_FIELDS)
+        fields = extract_fields(m_tag, ANCESTRY_FIELDS)
+        anc.hitPoints = fields['hitPoints'].value
+        anc.size = fields['size'].value
+        anc.speed = fields['speed'].value
+        anc.abilityBoosts = fields['abilityBoosts'].value
+        if fields.get('abilityFlaws'):
+            anc.abilityFlaws = fields['abilityFlaws'].value
+        anc.languages = fields['languages'].value
 
         dvision_tag = m_tag.find_next(name='h2', text='Darkvision')
         ll_tag = m_tag.find_next(name='h2', text='Low-Light Vision')
@@ -616,7 +543,7 @@ def parse_ancestries(pages: List[str]) -> Optional[List[object]]:
             anc.senses.append(AncestryHeader('Low-Light Vision', 'You can see in dim light as though it were bright light, so you ignore the concealed condition due to dim light.'))
 
         # the rest are extras
-        extras_tag: Tag = lang_tag.previous.find_next('h2')
+        extras_tag: Optional[Tag] = fields['languages'].end
         if extras_tag:
             end_tag = [x for x in extras_tag.parent.children][-1]
             d_str: Union[str, List[List[str]]] = ''
@@ -646,15 +573,31 @@ def parse_ancestries(pages: List[str]) -> Optional[List[object]]:
     return ancestries
 
 
-def write_data(data: List[object], collection_name: str, index_on: str, f_name: str = None) -> None:
+# failed: ids whose fetch failed, so that the change feed does not report them as removed
+def write_data(data: List[object], collection_name: str, index_on: str, f_name: str = None,
+               connection: MongoClient = None, failed: List[int] = None) -> None:
+    if not data:
+        # an empty parse would otherwise replace the collection and log every record as removed
+        print('no records for {}, nothing written'.format(collection_name))
+        return
+    # diff against the previous scrape before insert_many adds an _id to every record
+    # the snapshot is only replaced below, once the records are written
+    changes, snapshot = compute_changes(data, collection_name, failed=failed or ())
+    print('{} records changed in {}'.format(len(changes), collection_name))
+    metrics.count('records_changed', len(changes), collection=collection_name)
+    metrics.count('records_written', len(data), collection=collection_name)
     if f_name:
         with open(f_name, 'w', encoding='utf-8') as outfile:
             print('writing to file')
             outfile.writelines(str(x) for x in data)
         print('completed writing {} lines to file {}'.format(len(data), f_name))
+        save_changes(changes, snapshot, collection_name)
     else:
-        print('connecting to database...')
-        connection = MongoClient(config.mongo_connection_string)
+        # a connection passed in by the caller is shared with other writers and is left open
+        shared = connection is not None
+        if not shared:
+            print('connecting to database...')
+            connection = MongoClient(config.mongo_connection_string)
         if not connection:
             print('error connecting to database')
             return
@@ -665,48 +608,225 @@ def write_data(data: List[object], collection_name: str, index_on: str, f_name:
         db.create_collection(collection_name)
         db[collection_name].create_index(index_on)
         db[collection_name].insert_many(data)
-        print('done. closing connection')
-        connection.close()
-
-
-def scrape(typ: GameType, cache_only: bool = None, out_file: str = None):
+        if changes:
+            db['changes'].create_index([('collection', 1), ('id', 1)])
+            # insert_many adds an ObjectId _id to what it is given, which the json feed could not write
+            db['changes'].insert_many([dict(c) for c in changes])
+        save_changes(changes, snapshot, collection_name)
+        if not shared:
+            print('done. closing connection')
+            connection.close()
+
+
+# collection name, index field, parser and record dataclass for each implemented GameType
+def get_scrape_params(typ: GameType) \
+        -> Optional[Tuple[str, str, Callable[[Iterable[Tuple[int, Any]], Optional[bool]], List[object]], type]]:
     if typ == GameType.CREATURE:
-        col_name: str = 'creatures'
-        index_on: str = 'name'
-        parse_func = parse_creatures
+        return 'creatures', 'name', parse_creatures, Creature
     elif typ == GameType.TRAIT:
-        col_name: str = 'traits'
-        index_on: str = 'name'
-        parse_func = parse_traits
+        return 'traits', 'name', parse_traits, Trait
     elif typ == GameType.ANCESTRY:
-        col_name: str = 'ancestries'
-        index_on: str = 'name'
-        parse_func = parse_ancestries
-    else:
-        print('Invalid GameType')
-        return
-
-    pages: List[str] = fetch_pages(typ, cache_only)
-    if not pages:
+        return 'ancestries', 'name', parse_ancestries, Ancestry
+    return None
+
+
+# fetch and parse a single GameType, recording the time spent on each step in timings
+# and the ids whose fetch failed in failed
+def scrape_data(typ: GameType, cache_only: bool = None, pool: Executor = None,
+                timings: Dict[str, float] = None, ids: Iterable[int] = None,
+                failed: List[int] = None) -> Optional[List[object]]:
+    timings = {} if timings is None else timings
+    _, _, parse_func, _ = get_scrape_params(typ)
+    start = time.perf_counter()
+    # cached pages are read while parsing, so for cache_only runs the parse time includes reading them
+    pages: Iterable[Tuple[int, Any]] = iter_cached_pages(typ, ids) if cache_only \
+        else fetch_pages(typ, cache_only, pool, ids, failed)
+    timings['fetch'] = time.perf_counter() - start
+    metrics.observe('stage_seconds', timings['fetch'], type=typ.value, stage='fetch')
+    if not cache_only and not pages:
         print('Pages could not be fetched')
-        return
+        return None
 
-    data: List[object] = parse_func(pages)
+    start = time.perf_counter()
+    data: List[object] = parse_func(pages, cache_only)
+    timings['parse'] = time.perf_counter() - start
+    metrics.observe('stage_seconds', timings['parse'], type=typ.value, stage='parse')
+    metrics.count('records_parsed', len(data or []), type=typ.value)
+    metrics.event('parsed', type=typ.value, records=len(data or []), seconds=timings['parse'])
     if not data:
         print('Pages could not be parsed')
+    return data
+
+
+# sparse: leave out fields that hold their default value (see encoding.decode_sparse for reading them back)
+# shard: (i, N) to only scrape the i-th of N parts of the ids and write them to shard_dir instead (see shard.py)
+def scrape(typ: GameType, cache_only: bool = None, out_file: str = None, pool: Executor = None,
+           connection: MongoClient = None, sparse: bool = False, shard: Tuple[int, int] = None,
+           shard_by: str = 'range', shard_dir: str = 'shards') -> Optional[Dict[str, float]]:
+    params = get_scrape_params(typ)
+    if not params:
+        print('Invalid GameType')
+        return None
+    col_name, index_on, _, record_type = params
+    all_ids = range(1, get_fetch_params(typ)[2])
+
+    timings: Dict[str, float] = {}
+    failed: List[int] = []
+    data = scrape_data(typ, cache_only, pool, timings, shard_ids(all_ids, *shard, shard_by) if shard else None,
+                       failed)
+    if data is None:
+        return timings
+    if sparse:
+        data = [encode_sparse(record_type, d) for d in data]
+
+    start = time.perf_counter()
+    if shard:
+        write_partial(data, col_name, *shard, shard_by, all_ids, shard_dir, failed)
+    else:
+        write_data(data, col_name, index_on, out_file, connection, failed)
+    timings['write'] = time.perf_counter() - start
+    return timings
+
 
+# combine the partial outputs of every shard of typ into one dataset, written like a normal scrape
+def merge(typ: GameType, out_file: str = None, shard_dir: str = 'shards') -> None:
+    params = get_scrape_params(typ)
+    if not params:
+        print('Invalid GameType')
+        return
+    col_name, index_on, _, _ = params
+    try:
+        data = merge_partials(col_name, shard_dir)
+    except ValueError as e:
+        print('could not merge shards: {}'.format(e))
+        sys.exit(1)
     write_data(data, col_name, index_on, out_file)
 
 
+def write_timed(data: List[object], collection_name: str, index_on: str, f_name: str = None,
+                connection: MongoClient = None, timings: Dict[str, float] = None, failed: List[int] = None) -> None:
+    start = time.perf_counter()
+    write_data(data, collection_name, index_on, f_name, connection, failed)
+    if timings is not None:
+        timings['write'] = time.perf_counter() - start
+
+
+# each stage runs concurrently; later stages wait on earlier ones (trait groups before creature trait references)
+SCRAPE_ALL_STAGES: List[List[GameType]] = [
+    [GameType.TRAIT],
+    [GameType.CREATURE, GameType.ANCESTRY],
+]
+
+
+# normalized: creatures and ancestries store trait names, and any trait they reference is interned into traits
+def scrape_all(cache_only: bool = None, out_file: str = None, workers: int = 8,
+               normalized: bool = False, sparse: bool = False) -> Dict[GameType, Dict[str, float]]:
+    timings: Dict[GameType, Dict[str, float]] = {typ: {} for stage in SCRAPE_ALL_STAGES for typ in stage}
+    data: Dict[GameType, List[object]] = {}
+    failed: Dict[GameType, List[int]] = {typ: [] for typ in timings}
+    connection = None if out_file else MongoClient(config.mongo_connection_string, maxPoolSize=workers)
+    start = time.perf_counter()
+    try:
+        # fetches are submitted to pool from inside the scrape jobs, so the jobs need their own executor
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for stage in SCRAPE_ALL_STAGES:
+                with ThreadPoolExecutor(max_workers=len(stage)) as runner:
+                    jobs = {typ: runner.submit(scrape_data, typ, cache_only, pool, timings[typ], None, failed[typ])
+                            for typ in stage}
+                for typ, job in jobs.items():
+                    if job.result() is not None:
+                        data[typ] = job.result()
+
+        if normalized and data.get(GameType.TRAIT) is not None:
+            for typ in (GameType.CREATURE, GameType.ANCESTRY):
+                if data.get(typ):
+                    step = time.perf_counter()
+                    intern_traits(data[typ], data[GameType.TRAIT])
+                    timings[typ]['intern'] = time.perf_counter() - step
+        if sparse:
+            data = {typ: [encode_sparse(get_scrape_params(typ)[3], d) for d in records]
+                    for typ, records in data.items()}
+
+        # writes go last so that traits interned above are part of the traits collection
+        # each type gets its own file next to out_file, e.g. out/data.txt -> out/creature_data.txt
+        with ThreadPoolExecutor(max_workers=len(data) or 1) as runner:
+            writes = [runner.submit(write_timed, records, *get_scrape_params(typ)[:2],
+                                    os.path.join(os.path.dirname(out_file),
+                                                 '{}_{}'.format(typ.value, os.path.basename(out_file)))
+                                    if out_file else None, connection, timings[typ], failed[typ])
+                      for typ, records in data.items()]
+        for write in writes:
+            write.result()
+    finally:
+        if connection:
+            connection.close()
+    total = time.perf_counter() - start
+
+    print('{:<12}{:>10}{:>10}{:>10}{:>10}'.format('type', 'fetch', 'parse', 'intern', 'write'))
+    for typ, t in timings.items():
+        print('{:<12}{:>10.2f}{:>10.2f}{:>10.2f}{:>10.2f}'.format(typ.value, t.get('fetch', 0), t.get('parse', 0),
+                                                                  t.get('intern', 0), t.get('write', 0)))
+    print('total {:.2f}s'.format(total))
+    return timings
+
+
+# read a collection back, optionally replacing the trait names of normalized documents with the full traits
+# with a record_type, documents (sparse or not) are loaded into that dataclass with any missing fields defaulted
+def load_data(collection_name: str, resolve: bool = False, connection: MongoClient = None,
+              record_type: type = None) -> List[Any]:
+    shared = connection is not None
+    if not shared:
+        connection = MongoClient(config.mongo_connection_string)
+    db = connection['2etools']
+    records = list(db[collection_name].find({}, {'_id': False}))
+    if resolve:
+        names = list({t for r in records for t in r.get('traits', []) if isinstance(t, str)})
+        resolve_traits(records, list(db['traits'].find({'name': {'$in': names}}, {'_id': False})))
+    if not shared:
+        connection.close()
+    return [decode_sparse(record_type, r) for r in records] if record_type else records
+
+
 if __name__ == '__main__':
-    if len(sys.argv) < 2 or sys.argv[1] not in [x.value for x in GameType]:
-        print('usage: scraper.py TYPE [cache_only] [out_file_name]')
-        sys.exit(0)
-    game_type: GameType = GameType(sys.argv[1])
-    arg_cache_only = None
-    out_file_name = None
-    if len(sys.argv) >= 3 and sys.argv[2] == 'cache_only':
-        arg_cache_only = True
-    if len(sys.argv) >= 4 and sys.argv[3]:
-        out_file_name = sys.argv[2]
-    scrape(game_type, arg_cache_only, out_file_name)
+    arg_parser = argparse.ArgumentParser(description='scrape 2e.aonprd.com into the 2etools database')
+    arg_parser.add_argument('type', choices=[x.value for x in GameType] + ['all'])
+    arg_parser.add_argument('cache_only', nargs='?', help="'cache_only' to only parse pages found in data/")
+    arg_parser.add_argument('out_file_name', nargs='?', help='write to this file instead of the database')
+    arg_parser.add_argument('--normalized', action='store_true', help='store trait names instead of traits (all only)')
+    arg_parser.add_argument('--sparse', action='store_true', help='leave out fields that hold their default value')
+    arg_parser.add_argument('--base-url', help='fetch from this site instead of {}'.format(config.aon_base_url))
+    arg_parser.add_argument('--quiet', action='store_true', help='no progress output')
+    arg_parser.add_argument('--events', help='append json event lines to this file')
+    arg_parser.add_argument('--metrics-file', help='write counters and histograms to this prometheus textfile')
+    arg_parser.add_argument('--shard', help='i/N: only scrape the i-th of N parts of the ids, for merging later')
+    arg_parser.add_argument('--shard-by', choices=['range', 'hash'], default='range', help='how ids are split')
+    arg_parser.add_argument('--shard-dir', default='shards', help='where shards are written and merged from')
+    arg_parser.add_argument('--merge', action='store_true', help='merge the shards of TYPE and write them')
+    args = arg_parser.parse_intermixed_args()
+    if args.normalized and args.type != 'all':
+        arg_parser.error('--normalized needs TYPE all, so that referenced traits can be interned')
+    arg_shard = None
+    if args.shard or args.merge:
+        if args.type == 'all':
+            arg_parser.error('--shard and --merge need a single TYPE')
+        try:
+            arg_shard = parse_shard(args.shard) if args.shard else None
+        except ValueError as e:
+            arg_parser.error(str(e))
+
+    metrics.configure(quiet=args.quiet, events_path=args.events, collect=bool(args.metrics_file))
+
+    if args.base_url:
+        config.aon_base_url = args.base_url.rstrip('/')
+    arg_cache_only = True if args.cache_only == 'cache_only' else None
+    if args.merge:
+        # there is no cache_only for a merge, so a lone positional argument is the out file
+        merge(GameType(args.type), args.out_file_name or args.cache_only, args.shard_dir)
+    elif args.type == 'all':
+        scrape_all(arg_cache_only, args.out_file_name, normalized=args.normalized, sparse=args.sparse)
+    else:
+        scrape(GameType(args.type), arg_cache_only, args.out_file_name, sparse=args.sparse, shard=arg_shard,
+               shard_by=args.shard_by, shard_dir=args.shard_dir)
+    if args.metrics_file:
+        metrics.write_prometheus(args.metrics_file)
+    metrics.close()
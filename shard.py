@@ -0,0 +1,112 @@
+import glob
+import hashlib
+import json
+import os
+from typing import List, Tuple, Iterable
+
+# a shard writes its records to <dir>/<collection>.<i>-of-<n>.jsonl next to a manifest describing what it covered
+# e.g. against a local stand-in server:
+#   python aon_server.py --port 8000 &
+#   for i in 1 2 3; do python scraper.py creature --base-url http://localhost:8000 --shard $i/3 & done; wait
+#   python scraper.py creature --merge
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    try:
+        index, count = (int(x) for x in spec.split('/'))
+    except ValueError:
+        raise ValueError('shard must look like i/N, got {}'.format(spec))
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError('shard index must be between 1 and N, got {}'.format(spec))
+    return index, count
+
+
+# range: contiguous blocks of ids, hash: ids spread evenly (a stable hash, so every node agrees)
+def shard_ids(ids: Iterable[int], index: int, count: int, by: str = 'range') -> List[int]:
+    ids = list(ids)
+    if by == 'hash':
+        return [i for i in ids if int(hashlib.sha1(str(i).encode()).hexdigest(), 16) % count == index - 1]
+    if by != 'range':
+        raise ValueError('unknown shard partitioning {}'.format(by))
+    size, extra = divmod(len(ids), count)
+    start = (index - 1) * size + min(index - 1, extra)
+    return ids[start:start + size + (1 if index <= extra else 0)]
+
+
+def partial_path(out_dir: str, collection_name: str, index: int, count: int) -> str:
+    return os.path.join(out_dir, '{}.{}-of-{}.jsonl'.format(collection_name, index, count))
+
+
+def file_sha1(path: str) -> str:
+    sha = hashlib.sha1()
+    with open(path, 'rb') as inf:
+        for block in iter(lambda: inf.read(1 << 16), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+# failed: ids of the shard that could not be fetched, which merge_partials refuses to merge without
+def write_partial(records: List[dict], collection_name: str, index: int, count: int, by: str,
+                  all_ids: Iterable[int], out_dir: str = 'shards', failed: Iterable[int] = ()) -> str:
+    os.makedirs(out_dir, exist_ok=True)
+    path = partial_path(out_dir, collection_name, index, count)
+    with open(path, 'w', encoding='utf-8') as outf:
+        outf.writelines(json.dumps(r, default=str) + '\n' for r in records)
+    manifest = {
+        'collection': collection_name,
+        'shard': index,
+        'shards': count,
+        'by': by,
+        'allIds': [min(all_ids), max(all_ids)],
+        'ids': shard_ids(all_ids, index, count, by),
+        'records': len(records),
+        'failed': sorted(failed),
+        'sha1': file_sha1(path),
+    }
+    with open(path[:-len('.jsonl')] + '.manifest.json', 'w', encoding='utf-8') as outf:
+        json.dump(manifest, outf)
+    print('wrote {} records for shard {}/{} to {}'.format(len(records), index, count, path))
+    if manifest['failed']:
+        print('{} ids could not be fetched, rerun shard {}/{} before merging'.format(len(manifest['failed']), index,
+                                                                                      count))
+    return path
+
+
+# check that the partial outputs of collection_name in out_dir cover every id exactly once, then combine them
+def merge_partials(collection_name: str, out_dir: str = 'shards') -> List[dict]:
+    manifests: List[dict] = []
+    for path in sorted(glob.glob(os.path.join(out_dir, '{}.*-of-*.manifest.json'.format(collection_name)))):
+        with open(path, 'r', encoding='utf-8') as inf:
+            manifests.append(json.load(inf))
+    if not manifests:
+        raise ValueError('no shards of {} found in {}'.format(collection_name, out_dir))
+
+    count, by, all_ids = manifests[0]['shards'], manifests[0]['by'], manifests[0]['allIds']
+    if any(m['shards'] != count or m['by'] != by or m['allIds'] != all_ids for m in manifests):
+        raise ValueError('shards of {} come from different runs'.format(collection_name))
+    found = sorted(m['shard'] for m in manifests)
+    if found != list(range(1, count + 1)):
+        raise ValueError('expected shards 1..{} of {}, found {}'.format(count, collection_name, found))
+
+    covered = [i for m in manifests for i in m['ids']]
+    if len(covered) != len(set(covered)) or set(covered) != set(range(all_ids[0], all_ids[1] + 1)):
+        raise ValueError('shards of {} do not cover ids {}..{} exactly once'.format(collection_name, *all_ids))
+    # a failed fetch leaves a record out of its shard, which would show up as removed in the change feed
+    failed = {m['shard']: m['failed'] for m in manifests if m.get('failed')}
+    if failed:
+        raise ValueError('some ids of {} could not be fetched, rerun these shards: {}'.format(
+            collection_name, '; '.join('{} (ids {})'.format(i, ', '.join(map(str, ids)))
+                                       for i, ids in sorted(failed.items()))))
+
+    records: List[dict] = []
+    for m in manifests:
+        path = partial_path(out_dir, collection_name, m['shard'], count)
+        if file_sha1(path) != m['sha1']:
+            raise ValueError('{} does not match its manifest'.format(path))
+        with open(path, 'r', encoding='utf-8') as inf:
+            shard_records = [json.loads(line) for line in inf if line.strip()]
+        ids = set(m['ids'])
+        if len(shard_records) != m['records'] or any(r.get('id') not in ids for r in shard_records):
+            raise ValueError('{} holds records outside of its shard'.format(path))
+        records.extend(shard_records)
+    return sorted(records, key=lambda r: r.get('id', 0))
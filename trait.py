@@ -1,3 +1,5 @@
+import dataclasses
+import hashlib
 from typing import List
 
 from source import Source
@@ -14,3 +16,35 @@ class Trait:
 
     def __eq__(self, other):
         return self.name == other.name if type(other) == Trait else self.name == other
+
+
+# traits only seen on creature/ancestry pages have no AoN id, so they get a negative one derived from their name
+# (stable between runs whatever order they are found in, and never one that AoN could hand out)
+def interned_trait_id(name: str) -> int:
+    return -1 - int(hashlib.sha1(name.encode('utf8')).hexdigest()[:12], 16)
+
+
+# normalized documents store trait names (the traits collection is indexed on name) instead of embedded traits
+def intern_traits(records: List[dict], traits: List[dict]) -> List[dict]:
+    known = {t['name'] for t in traits}
+    for record in records:
+        names: List[str] = []
+        for t in record.get('traits', []):
+            name = t['name'] if isinstance(t, dict) else str(t)
+            if name not in known:
+                # traits only seen on creature/ancestry pages still get a document so that every reference resolves
+                interned = Trait(id=interned_trait_id(name), name=name,
+                                 description=t.get('description', '') if isinstance(t, dict) else '')
+                traits.append(dataclasses.asdict(interned))
+                known.add(name)
+            names.append(name)
+        record['traits'] = names
+    return records
+
+
+def resolve_traits(records: List[dict], traits: List[dict]) -> List[dict]:
+    by_name = {t['name']: t for t in traits}
+    for record in records:
+        record['traits'] = [by_name.get(t, dataclasses.asdict(Trait(name=t))) if isinstance(t, str) else t
+                            for t in record.get('traits', [])]
+    return records